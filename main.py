@@ -1,23 +1,106 @@
+import asyncio
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from alpaca.trading.requests import (
     MarketOrderRequest,
     TakeProfitRequest,
     StopLossRequest,
 )
-from alpaca.trading.enums import OrderSide, TimeInForce, OrderClass
+from alpaca.trading.enums import OrderSide, TimeInForce, OrderClass, TradeEvent
 from alpaca.common import APIError
 import datetime
+import diskcache
+import hashlib
+from dataclasses import dataclass
+import numpy as np
 from datetime import timedelta
 import openai
+import orjson
 import scraper
 import stock_news
-import yfinance as yf
+import tiktoken
+from alpaca.data.enums import DataFeed
+from alpaca.data.historical import StockHistoricalDataClient
+from alpaca.data.requests import StockBarsRequest, StockLatestQuoteRequest
+from alpaca.data.timeframe import TimeFrame
 from alpaca.trading.client import TradingClient
+from alpaca.trading.stream import TradingStream
 import os
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+DECISION_CACHE_EXPIRY = 7 * 86400
+POSITION_CHECK_INTERVAL = 900
+
+LIMIT_ORDER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "limit",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"price": {"type": "number"}},
+            "required": ["price"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+@dataclass(slots=True)
+class AnalysedStock:
+    """
+    The Analysis Result of a Stock Worth Buying
+
+    Attributes:
+        ticker (str): The ticker symbol of the stock.
+        limit (float): The predicted sell limit order price.
+        spread (float): The spread between the predicted limit price and the current price.
+        price (float): The current price of the stock at the time of the analysis.
+    """
+
+    ticker: str
+    limit: float
+    spread: float
+    price: float
+
+
+def _reallocate(values: np.ndarray) -> np.ndarray:
+    """
+    Converts allocation values sorted in descending order into corrected percentages
+
+    Args:
+        values (np.ndarray): The allocation values, sorted in descending order
+
+    Returns:
+        np.ndarray: The corrected allocation percentages, in the same order as the values
+    """
+    percentages = values / values.sum() * 100
+
+    if len(percentages) > 1 and percentages[0] <= (percentages[1] * 1.2):
+        percentages[0] = percentages[1] * 1.2
+
+    # Scale the tail down by the excess percentage
+    extra_percent = percentages.sum() - 100
+    tail_sum = percentages[1:].sum()
+    if tail_sum != 0:
+        percentages[1:] *= 1 - extra_percent / tail_sum
+
+    percentages = np.maximum(percentages, 0.0)
+    return percentages / percentages.sum() * 100
+
+
+if numba is not None:
+    _reallocate = numba.njit(cache=True)(_reallocate)
+
 
 class StockTradingBot:
-    def __init__(self, alpaca_key, alpaca_secret, openai_key, apikey, openai_model="gpt-4o"):
+    def __init__(self, alpaca_key, alpaca_secret, openai_key, apikey, openai_model="gpt-4o", max_concurrent_requests=4):
         """
         Initializes the trading and OpenAI clients, and sets up prompts for analysis tasks.
 
@@ -26,6 +109,7 @@ class StockTradingBot:
             alpaca_secret (str): Your Alpaca API secret key used for authentication.
             openai_key (str): Your OpenAI API key used for authentication.
             openai_model (str, optional): The model name for OpenAI API queries. Default is "gpt-4o".
+            max_concurrent_requests (int, optional): The maximum number of OpenAI requests in flight at once. Default is 4.
 
         Attributes:
             alpaca_key (str): Stores the Alpaca API key.
@@ -33,11 +117,21 @@ class StockTradingBot:
             openai_key (str): Stores the OpenAI API key.
             trading_client (TradingClient): Instance of the TradingClient initialized with Alpaca API credentials.
             account (Account): The account information retrieved from the Alpaca API.
-            openai_client (openai.OpenAI): The OpenAI client initialized with the provided API key.
+            data_client (StockHistoricalDataClient): Instance of the StockHistoricalDataClient used to fetch historical bars.
+            trading_stream (TradingStream): Websocket stream of trade updates from the Alpaca API, used to react when positions close.
+            streaming (bool): Whether the trade updates stream has been started.
+            rebalance_lock (threading.Lock): Held while a position check is pending or running.
+            rebalance_executor (ThreadPoolExecutor): Worker that runs the position checks off the stream's event loop.
+            openai_client (openai.AsyncOpenAI): The asynchronous OpenAI client initialized with the provided API key.
+            event_loop (asyncio.AbstractEventLoop): The event loop the OpenAI client runs on, reused across runs.
             openai_model (str): The name of the OpenAI model to be used.
+            openai_semaphore (asyncio.Semaphore): Limits the number of OpenAI requests in flight at once.
+            decision_cache (diskcache.Cache): Analyser decisions keyed by the model, the analyser prompt, the ticker symbol and a hash of the news, persisted across runs.
             num_of_stocks (int): A counter tracking the number of stocks, initialized to 0.
             limit_order_prompt (str): Prompt text for analyzing stock sell limit order prices.
             analyser_prompt (str): Prompt text for evaluating a company's growth potential as "evergreen".
+            analyser_logit_bias (dict): Logit bias restricting the analyser's answer to the tokens of 'yes' and 'no'.
+            analyser_prompt_hash (str): Hash of the analyser prompt, used as part of the decision cache key.
 
         """
         self.alpaca_key = alpaca_key
@@ -49,8 +143,22 @@ class StockTradingBot:
             self.alpaca_key, self.alpaca_secret, paper=True
         )
         self.account = self.trading_client.get_account()
-        self.openai_client = openai.OpenAI(api_key=self.openai_key)
+        self.data_client = StockHistoricalDataClient(
+            self.alpaca_key, self.alpaca_secret
+        )
+        self.trading_stream = TradingStream(
+            self.alpaca_key, self.alpaca_secret, paper=True
+        )
+        self.trading_stream.subscribe_trade_updates(self.on_trade_update)
+        self.streaming = False
+        self.rebalance_lock = threading.Lock()
+        self.rebalance_executor = ThreadPoolExecutor(max_workers=1)
+        self.openai_client = openai.AsyncOpenAI(api_key=self.openai_key)
+        self.event_loop = asyncio.new_event_loop()
         self.openai_model = openai_model
+        self.openai_semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+        self.decision_cache = diskcache.Cache("decision_cache")
 
         self.num_of_stocks = 0
         self.limit_order_prompt = (
@@ -70,22 +178,47 @@ class StockTradingBot:
             "Remember, your analysis should take into account the specific details of the news provided and any known factors about the company's sector, operational model, or financial health that can influence its future growth potential. Strictly answer with a yes or no"
         )
 
-    def get_current_price(self, ticker) -> float | None:
+        # Look up the answer tokens for the analyser
+        try:
+            self._enc = tiktoken.encoding_for_model(self.openai_model)
+        except KeyError:
+            self._enc = tiktoken.get_encoding("o200k_base")
+        self._yes_ids = [self._enc.encode(answer)[0] for answer in ("Yes", "yes")]
+        self._no_ids = [self._enc.encode(answer)[0] for answer in ("No", "no")]
+        self.analyser_logit_bias = {
+            token_id: 100 for token_id in self._yes_ids + self._no_ids
+        }
+        self.analyser_prompt_hash = hashlib.blake2b(
+            self.analyser_prompt.encode(), digest_size=16
+        ).hexdigest()
+
+    def get_current_prices(self, tickers) -> dict:
         """
-        Gets the Current Price of a Ticker
+        Gets the Current Prices of Several Tickers in One Request
+
+        The ask price of the latest Alpaca quote is used as the current price.
 
         Args:
-            ticker (str): Ticker Symbol
+            tickers (list): Ticker Symbols
 
         Returns:
-            str: The Current Price of A ticker
+            dict: The Current Price of Each Ticker that has an ask price quoted
         """
+        if not tickers:
+            return {}
+
+        request = StockLatestQuoteRequest(symbol_or_symbols=tickers, feed=DataFeed.IEX)
         try:
-            current_price = yf.Ticker(ticker).info["currentPrice"]
-            return current_price
+            quotes = self.data_client.get_stock_latest_quote(request)
         except Exception as e:
-            print(f"An error occurred when fetching current price for {ticker}: {e}")
-            return None
+            print(f"An error occurred when fetching current prices: {e}")
+            return {}
+
+        return {
+            ticker: quote.ask_price
+            for ticker, quote in quotes.items()
+            if quote.ask_price
+        }
 
     def round_to_two_decimals(self, price: float) -> float:
         """
@@ -100,75 +233,109 @@ class StockTradingBot:
         return round(price, 2)
 
     def get_historical_stock_data(
-        self, symbol, start_date: datetime, end_date: datetime
-    ) -> (list, float):
+        self, symbols, start_date: datetime, end_date: datetime
+    ) -> dict:
         """
-        Fetches historical stock data and current price.
+        Fetches historical stock data and current prices for several stocks at once.
 
-        This method uses the `yfinance` library to download the historical stock
-        data for a given ticker symbol within a specified date range. It then extracts
-        the closing price data, rounds the values, and returns them as a list along
-        with the current stock price.
+        This method uses Alpaca's historical data API to fetch the daily bars for all
+        the given ticker symbols within a specified date range in a single request. The IEX
+        feed is used, as free accounts may not query the most recent SIP data. It then
+        extracts the closing price data of each ticker, rounds the values, and returns them
+        as a list along with the current stock price, which is taken from the latest close
+        so that no additional request is needed.
 
         Args:
-            symbol (str): The ticker symbol of the stock.
+            symbols (list): The ticker symbols of the stocks.
             start_date (datetime): The start date for the historical data in 'YYYY-MM-DD' format.
             end_date (datetime): The end date for the historical data in 'YYYY-MM-DD' format.
 
         Returns:
-            tuple: A tuple containing two elements:
+            dict: A dictionary mapping each ticker symbol to a tuple containing two elements:
                 - list: A list of rounded closing prices between the start and end dates.
                 - float: The current price of the stock.
 
         Raises:
-            Exception: If an error occurs during the data retrieval, it is caught, printed, and the function returns None.
+            Exception: If an error occurs during the data retrieval, it is caught and printed. Tickers
+                       whose data could not be retrieved are left out of the returned dictionary.
         """
+        result = {}
+        if not symbols:
+            return result
+
+        request = StockBarsRequest(
+            symbol_or_symbols=symbols,
+            timeframe=TimeFrame.Day,
+            start=start_date,
+            end=end_date,
+            feed=DataFeed.IEX,
+        )
         try:
-            stock_data = yf.download(symbol, start=start_date, end=end_date)
-            data = stock_data["Close"].round().to_list()
-            current_price = yf.Ticker(symbol).info["currentPrice"]
-            return data, current_price
+            bars = self.data_client.get_stock_bars(request)
         except Exception as e:
             print(f"An error occurred: {e}")
-            return None
+            return result
+
+        for symbol in symbols:
+            symbol_bars = bars.data.get(symbol)
+            if not symbol_bars:
+                print(f"No historical data was returned for {symbol}, skipping it")
+                continue
+            result[symbol] = (
+                [round(bar.close, 0) for bar in symbol_bars],
+                symbol_bars[-1].close,
+            )
 
-    def complete_chat_forward(self, blog, stock_symbol) -> str:
+        return result
+
+    async def complete_chat_forward(self, blog, stock_symbol) -> str | None:
         """
         Generates a completion using the OpenAI API based on provided stock news and symbol.
 
         This method leverages the OpenAI API to analyze a given blog/news content related to a
         specific stock symbol and predict the company's growth potential. The response indicates
         if the company is considered 'evergreen' or not, as per the specified Analyzer Prompt.
+        Since the answer is a single word, the completion is limited to one token and biased
+        towards the tokens of 'yes' and 'no' that are looked up once at initialization.
 
         Args:
             blog (str): The news or blog content related to the company.
             stock_symbol (str): The ticker symbol of the stock.
 
         Returns:
-            str: The completion result from OpenAI, indicating 'yes' or 'no' regarding the company's growth potential.
-        """
-        completion = self.openai_client.chat.completions.create(
-            model=self.openai_model,
-            messages=[
-                {"role": "system", "content": self.analyser_prompt},
-                {
-                    "role": "user",
-                    "content": f"Ticker Symbol: {stock_symbol} News: {blog}",
-                },
-            ],
-            temperature=1,
-            stream=False,
-            seed=50,
-        )
-        return completion.choices[0].message.content.lower()
+            str: The completion result from OpenAI, indicating 'yes' or 'no' regarding the company's growth potential,
+                 or None if the request failed.
+        """
+        try:
+            async with self.openai_semaphore:
+                completion = await self.openai_client.chat.completions.create(
+                    model=self.openai_model,
+                    messages=[
+                        {"role": "system", "content": self.analyser_prompt},
+                        {
+                            "role": "user",
+                            "content": f"Ticker Symbol: {stock_symbol} News: {blog}",
+                        },
+                    ],
+                    temperature=1,
+                    stream=False,
+                    seed=50,
+                    max_tokens=1,
+                    logit_bias=self.analyser_logit_bias,
+                )
+        except openai.OpenAIError as e:
+            print(f"An error occurred when analysing {stock_symbol}: {e}")
+            return None
+        return completion.choices[0].message.content.strip().lower()
 
-    def limit_order_predictor(self, data, news, curr_price) -> str:
+    async def limit_order_predictor(self, data, news, curr_price) -> float | None:
         """
         Predicts an optimal sell limit order price using the OpenAI API.
 
         This method uses the OpenAI API to analyze provided historical stock data,
         current stock price, and recent news about the company. It generates a suggested
-        sell limit order price based on the analysis.
+        sell limit order price based on the analysis. The response is constrained to a JSON
+        object holding the price, so no free-form text has to be parsed.
 
         Args:
             data (str): A list of historical closing prices of the stock.
@@ -176,23 +343,32 @@ class StockTradingBot:
             curr_price (str): The current price of the stock.
 
         Returns:
-            str: The predicted sell limit order price as a string. The completion result from
-            OpenAI should be returned as a numeric value representing the price.
-        """
-        completion = self.openai_client.chat.completions.create(
-            model=self.openai_model,
-            messages=[
-                {"role": "system", "content": self.limit_order_prompt},
-                {
-                    "role": "user",
-                    "content": f"Historical data: {data} Current price:{curr_price} News: {news}",
-                },
-            ],
-            temperature=0.7,
-            stream=False,
-            seed=50,
-        )
-        return completion.choices[0].message.content.lower()
+            float: The predicted sell limit order price, or None if the request failed or the response could not be parsed.
+        """
+        try:
+            async with self.openai_semaphore:
+                completion = await self.openai_client.chat.completions.create(
+                    model=self.openai_model,
+                    messages=[
+                        {"role": "system", "content": self.limit_order_prompt},
+                        {
+                            "role": "user",
+                            "content": f"Historical data: {data} Current price:{curr_price} News: {news}",
+                        },
+                    ],
+                    temperature=0.7,
+                    stream=False,
+                    seed=50,
+                    response_format=LIMIT_ORDER_RESPONSE_FORMAT,
+                )
+        except openai.OpenAIError as e:
+            print(f"An error occurred when predicting the limit sell order: {e}")
+            return None
+        try:
+            return float(orjson.loads(completion.choices[0].message.content)["price"])
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            print(f"An error occurred when parsing the limit sell order: {e}")
+            return None
 
     def order_management(
         self, ticker, quantity, take_profit_limit, stop_loss_price
@@ -258,7 +434,8 @@ class StockTradingBot:
         percentages, and ensures that the highest percentage is at least 20% greater than the
         second highest. It then adjusts the remaining percentages to ensure the total sums
         up to 100%. The method returns a new dictionary with the keys mapped to their
-        corrected percentage values.
+        corrected percentage values. Negative values are allocated nothing, and if no value is
+        positive every key is allocated 0%.
 
         Args:
             input_dict (dict): A dictionary where keys are items to allocate and values
@@ -268,35 +445,131 @@ class StockTradingBot:
             dict: A dictionary where keys are the same items and values are their corrected
                   allocation percentages.
         """
+        if not input_dict:
+            return {}
+
         keys = list(input_dict.keys())
-        values = list(input_dict.values())
-        total_value = sum(values)
+        values = np.fromiter(input_dict.values(), dtype=np.float64, count=len(keys))
+        values = np.maximum(values, 0.0)
+
+        if values.sum() == 0:
+            return {key: 0.0 for key in keys}
+
+        order = np.argsort(-values, kind="stable")
+        percentages = _reallocate(values[order])
+
+        result = {
+            keys[original_idx]: float(percentage)
+            for original_idx, percentage in zip(order, percentages)
+        }
+
+        return result
+
+    async def analyse_stocks(self) -> list:
+        """
+        Analyses the discovered stocks and predicts limit sell order prices concurrently.
+
+        The news for every discovered stock is scraped concurrently over a pooled session, and
+        stocks whose news could not be scraped are skipped. The analyser prompts for news that
+        has not been analysed before are then dispatched to the OpenAI API concurrently.
+        Historical data is fetched for all the stocks worth buying in a single request, and
+        the limit order prompts are dispatched concurrently as well. The number of requests in
+        flight is bounded by the OpenAI semaphore, and a failed request only skips its own ticker.
+
+        Returns:
+            list: A list of AnalysedStock rows, one per stock worth buying.
+        """
+        output = []
+        data = stock_news.stock_discovery(self.alphavantageapikey)
+        session = scraper.get_session()
+        scraped_blogs = await asyncio.gather(
+            *[scraper.scrape_blog(session, news) for news in data.values()]
+        )
 
-        indexed_values = sorted(
-            ((value, index) for index, value in enumerate(values)), reverse=True
+        symbols, blogs = [], []
+        for stock_symbol, blog in zip(data, scraped_blogs):
+            blog = (blog or "").strip()
+            if not blog:
+                print("NO NEWS FOR ", stock_symbol)
+                continue
+            symbols.append(stock_symbol)
+            blogs.append(blog)
+
+        # Replay decisions on news that has already been analysed
+        cache_keys = [
+            (
+                self.openai_model,
+                self.analyser_prompt_hash,
+                stock_symbol,
+                hashlib.blake2b(blog.encode(), digest_size=16).hexdigest(),
+            )
+            for stock_symbol, blog in zip(symbols, blogs)
+        ]
+        decisions = [self.decision_cache.get(cache_key) for cache_key in cache_keys]
+        misses = [index for index, decision in enumerate(decisions) if decision is None]
+
+        fresh_decisions = await asyncio.gather(
+            *[self.complete_chat_forward(blogs[index], symbols[index]) for index in misses]
         )
-        percentages = [(value / total_value) * 100 for value, _ in indexed_values]
+        for index, decision in zip(misses, fresh_decisions):
+            decisions[index] = decision
+            if decision is None:
+                continue
+            self.decision_cache.set(
+                cache_keys[index], decision, expire=DECISION_CACHE_EXPIRY
+            )
 
-        if len(percentages) > 1 and percentages[0] <= (percentages[1] * 1.2):
-            percentages[0] = percentages[1] * 1.2
+        bullish = []
+        for stock_symbol, blog, decision in zip(symbols, blogs, decisions):
+            if decision is None:
+                print("SKIPPING ", stock_symbol)
+            elif decision == "yes":
+                print("BUY ", stock_symbol)
+                bullish.append((stock_symbol, blog))
+            else:
+                print("DONT BUY ", stock_symbol)
 
-        extra_percent = sum(percentages) - 100
-        for i in range(1, len(percentages)):
-            percentages[i] -= (percentages[i] / sum(percentages[1:])) * extra_percent
+        end_date = datetime.datetime.now(datetime.timezone.utc)
+        start_date = end_date - timedelta(days=7)
+        historical_data = self.get_historical_stock_data(
+            [stock_symbol for stock_symbol, _ in bullish], start_date, end_date
+        )
 
-        for i in range(len(percentages)):
-            if percentages[i] < 0:
-                percentages[i] = 0
+        candidates = []
+        for stock_symbol, blog in bullish:
+            historical_prices, current_price = historical_data.get(
+                stock_symbol, (None, None)
+            )
+            if historical_prices and current_price:
+                candidates.append(
+                    (stock_symbol, blog, historical_prices, current_price)
+                )
 
-        sum_percentages = sum(percentages)
-        percentages = [p / sum_percentages * 100 for p in percentages]
+        limit_order_vals = await asyncio.gather(
+            *[
+                self.limit_order_predictor(
+                    str(historical_prices), blog, str(current_price)
+                )
+                for _, blog, historical_prices, current_price in candidates
+            ]
+        )
 
-        result = {}
-        for (value, original_idx), percentage in zip(indexed_values, percentages):
-            key = keys[original_idx]
-            result[key] = percentage
+        for (stock_symbol, _, _, current_price), limit_order_val in zip(
+            candidates, limit_order_vals
+        ):
+            if limit_order_val is None:
+                continue
+            print(f"The limit sell order: {limit_order_val}")
+            output.append(
+                AnalysedStock(
+                    ticker=stock_symbol,
+                    limit=limit_order_val,
+                    spread=limit_order_val - current_price,
+                    price=current_price,
+                )
+            )
 
-        return result
+        return output
 
     def logic_stock(self) -> None:
         """
@@ -306,9 +579,9 @@ class StockTradingBot:
         news, making buy/sell decisions, predicting limit sell order prices, and
         managing stock sell or hold orders. Specifically, it:
         - Retrieves stock symbols and corresponding news.
-        - Analyzes the news for each stock to decide whether to buy.
-        - Fetches historical data and current price for the stock if the decision is to buy.
-        - Predicts the optimal limit sell order price based on historical data, current price, and news.
+        - Analyzes the news for all stocks concurrently to decide whether to buy.
+        - Fetches historical data and current prices in one request for the stocks it decides to buy.
+        - Predicts the optimal limit sell order prices concurrently based on historical data, current price, and news.
         - Collects the analysis results, including ticker symbol, limit order value, and spread.
         - Manages stock sell or hold orders based on the analysis results.
 
@@ -317,33 +590,7 @@ class StockTradingBot:
         Returns:
             None
         """
-        output = []
-        data = stock_news.stock_discovery(self.alphavantageapikey)
-        for stock_symbol, news in data.items():
-            blog = str(scraper.scrape_blog(news)).strip()
-            decision = self.complete_chat_forward(blog, stock_symbol)
-            if decision == "yes":
-                print("BUY ", stock_symbol)
-                start_date = datetime.datetime.today()
-                end_date = start_date - timedelta(days=7)
-                historical_prices, current_price = self.get_historical_stock_data(
-                    stock_symbol, end_date, start_date
-                )
-                if historical_prices and current_price:
-                    limit_order_val = self.limit_order_predictor(
-                        str(historical_prices), blog, str(current_price)
-                    )
-                    print("The limit sell order: " + limit_order_val)
-                    output.append(
-                        {
-                            "Ticker": stock_symbol,
-                            "Limit": limit_order_val,
-                            "Spread": float(limit_order_val) - current_price,
-                        }
-                    )
-            else:
-                print("DONT BUY ", stock_symbol)
-
+        output = self.event_loop.run_until_complete(self.analyse_stocks())
         self.manage_stock_sell_or_hold(output)
 
     def extract_spreads(self, items):
@@ -351,12 +598,12 @@ class StockTradingBot:
         Maps The Ticker Symbol to Its Spread of Predicted Limit Price and Current Price
 
         Args:
-            items (list): The List Of Stocks, with their Features
+            items (list): The List Of AnalysedStock rows
 
         Returns:
-            None
+            dict: The Spread of Each Ticker
         """
-        result = {item["Ticker"]: item["Spread"] for item in items}
+        result = {item.ticker: item.spread for item in items}
         return result
 
     def calculate_stop_loss_price(self, current_price):
@@ -380,12 +627,12 @@ class StockTradingBot:
         1. Extracts the available cash.
         2. Extracts and corrects the stock spreads from the output.
         3. Allocates available cash among stocks based on corrected allocation percentages.
-        4. For each stock, fetches the current price and calculates the quantity to buy.
+        4. For each stock, fetches the current price and calculates the quantity to buy. The last close
+           recorded during analysis is used for stocks without a quoted ask price.
         5. Validates and defines take profit and stop loss prices, then places the order if valid.
 
         Args:
-            output (list): A list of dictionaries containing stock information, with each dictionary
-                           having keys 'Ticker', 'Limit', and 'Spread'.
+            output (list): A list of AnalysedStock rows containing the stock information.
 
         Returns:
             int: The number of positions currently held after performing the position sizing.
@@ -393,28 +640,26 @@ class StockTradingBot:
         cash = int(float(self.account.cash))
         stock_spread = self.extract_spreads(output)
         stocks = self.correct_allocate_percentages(stock_spread)
+        rows = {row.ticker: row for row in output}
+        current_prices = self.get_current_prices(list(stocks))
 
         print(f"Total available cash: {cash}")
         print(f"Stock spreads: {stock_spread}")
         print(f"Stocks allocation percentages: {stocks}")
 
-        for index, stock in enumerate(stocks):
-            current_price = self.get_current_price(stock)
-            if current_price is None:
-                print(f"Skipping {stock} due to error in fetching current price.")
-                continue
-
-            current_price = self.round_to_two_decimals(current_price)
+        for stock, percentage in stocks.items():
+            row = rows[stock]
+            current_price = self.round_to_two_decimals(
+                current_prices.get(stock, row.price)
+            )
             print(f"Current price of {stock}: {current_price}")
 
-            allotted_cash = (stocks[stock] / 100) * cash
+            allotted_cash = (percentage / 100) * cash
             quantity = round(allotted_cash / current_price)
             print(f"Allotted cash for {stock}: {allotted_cash}, Quantity: {quantity}")
 
             if quantity > 0:
-                take_profit_limit = self.round_to_two_decimals(
-                    float(output[index]["Limit"])
-                )
+                take_profit_limit = self.round_to_two_decimals(row.limit)
                 stop_loss_price = self.calculate_stop_loss_price(current_price)
                 if take_profit_limit > stop_loss_price:
                     self.order_management(
@@ -438,18 +683,64 @@ class StockTradingBot:
         """
         return self.trading_client.get_all_positions()
 
-    def manage_stock_sell_or_hold(self, output):
+    def schedule_rebalance(self) -> None:
         """
-        Controller Logic of The Programme
+        Hands a position check off to the rebalance worker, unless one is already pending or running.
         """
-        self.num_of_stocks = self.position_sizing(output)
-        while True:
+        if self.rebalance_lock.acquire(blocking=False):
+            self.rebalance_executor.submit(self.rebalance)
+
+    def rebalance(self) -> None:
+        """
+        Re-runs the analysis if fewer positions are held than were sized.
+
+        Runs on the rebalance worker, and releases the rebalance lock once done.
+        """
+        try:
             positions = self.get_positions()
             if len(positions) < self.num_of_stocks:
                 self.logic_stock()
-            else:
-                print("Auto Trader is Going To Sleep, and will get Activated Tomorrow again to analyse your Portfolio")
-                time.sleep(86400)
+        except Exception as e:
+            print(f"An error occurred when rebalancing the portfolio: {e}")
+        finally:
+            self.rebalance_lock.release()
+
+    def check_positions_periodically(self) -> None:
+        """
+        Schedules a position check at a fixed interval, in case a fill is missed by the stream.
+        """
+        while True:
+            time.sleep(POSITION_CHECK_INTERVAL)
+            self.schedule_rebalance()
+
+    async def on_trade_update(self, data):
+        """
+        Handles a trade update from the Alpaca stream, scheduling a position check when a position may have closed.
+
+        Only filled sell orders can close a position, so every other update is ignored.
+
+        Args:
+            data (TradeUpdate): The trade update received from the stream.
+        """
+        if data.event != TradeEvent.FILL or data.order.side != OrderSide.SELL:
+            return
+
+        self.schedule_rebalance()
+
+    def manage_stock_sell_or_hold(self, output):
+        """
+        Controller Logic of The Programme
+
+        Sizes the positions for the analysed stocks and then listens to the trade updates stream,
+        which calls back into `on_trade_update` whenever an order is filled. The positions are
+        also checked periodically, to recover from fills made while the stream was disconnected.
+        """
+        self.num_of_stocks = self.position_sizing(output)
+        if not self.streaming:
+            self.streaming = True
+            threading.Thread(target=self.check_positions_periodically, daemon=True).start()
+            print("Auto Trader is Going To Sleep, and will get Activated again when a position in your Portfolio closes")
+            self.trading_stream.run()
 
     def __call__(self):
         self.logic_stock()
@@ -1,45 +1,86 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import hashlib
+import re
 
+import aiohttp
+import diskcache
+from selectolax.parser import HTMLParser
 
-def scrape_blog(url):
-    # Send a GET request to the UR
+# Cache scraped text by URL hash
+blog_cache = diskcache.Cache("blog_cache")
+BLOG_CACHE_EXPIRY = 86400
+
+_WS = re.compile(r"\s+")
+MAX_BLOG_CHARS = 8000
+MIN_ARTICLE_CHARS = 500
+SCRAPE_TIMEOUT = 30
+
+_session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    # Pool connections to news sites within a run, idle ones are closed after a minute
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=SCRAPE_TIMEOUT),
+        )
+    return _session
+
+
+async def scrape_blog(session: aiohttp.ClientSession, url):
+    cache_key = hashlib.sha256(url.encode()).hexdigest()
+    cached_text = blog_cache.get(cache_key)
+    if cached_text is not None:
+        return cached_text
+
+    # Send a GET request to the URL over the shared session
     my_headers = {
         "User-Agent": """Mozilla/5.0 (Macintosh; Intel Mac OSX 10_14_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/71.0.3578.98 Safari/537.36"""
     }
-    session = requests.Session()
-    response = session.get(url, headers=my_headers)
-
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        # Parse the HTML content of the page using BeautifulSoup
-        if "zacks" in url:
-            # Find all paragraph tags and extract the text
-            soup = BeautifulSoup(response.content, "html.parser")
-
-            # Find all div elements with class "commentary_body" and extract the text
-            commentary_divs = soup.find_all("div", class_="commentary_body")
-
-            # Concatenate the text from all commentary divs
-            all_text = " ".join(
-                [commentary_div.get_text() for commentary_div in commentary_divs]
-            )
-
-            return all_text
-        else:
-            soup = BeautifulSoup(response.content, "html.parser")
-            # Find and extract the text content of the blog post
-            blog_text = soup.get_text()
-
-            # Print or return the scraped text
-            return blog_text
+    try:
+        async with session.get(url, headers=my_headers) as response:
+            # Check if the request was successful (status code 200)
+            if response.status != 200:
+                print(f"Failed to retrieve the webpage. Status code: {response.status}")
+                return None
+            content = await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Failed to retrieve the webpage {url}: {e!r}")
+        return None
+
+    # Parse the HTML content of the page using selectolax
+    tree = HTMLParser(content)
+    if "zacks" in url:
+        # Find all div elements with class "commentary_body" and extract the text
+        commentary_divs = tree.css("div.commentary_body")
+
+        # Concatenate the text from all commentary divs
+        blog_text = " ".join(
+            [commentary_div.text() for commentary_div in commentary_divs]
+        )
     else:
-        print(f"Failed to retrieve the webpage. Status code: {response.status_code}")
+        # Extract the text of the longest article, falling back to the page body
+        tree.strip_tags(["script", "style", "noscript"])
+        article_texts = [
+            node.text(separator=" ") for node in tree.css("article, main, .content")
+        ]
+        blog_text = max(article_texts, key=len, default="")
+        if len(blog_text.strip()) < MIN_ARTICLE_CHARS:
+            root = tree.body or tree.root
+            blog_text = root.text(separator=" ") if root is not None else ""
+
+    # Squash whitespace and cap the length
+    blog_text = _WS.sub(" ", blog_text).strip()[:MAX_BLOG_CHARS]
+
+    blog_cache.set(cache_key, blog_text, expire=BLOG_CACHE_EXPIRY)
+    return blog_text
 
 
 # Example usage
 # blog_url = "https://www.benzinga.com/news/24/02/36937329/whats-going-on-with-taiwan-semiconductor-manufacturing-stock-monday"
-# scraped_text = scrape_blog(blog_url)
+# scraped_text = await scrape_blog(get_session(), blog_url)
 
 # Print or process the scraped text as needed
 # print(scraped_text)
@@ -1,21 +1,31 @@
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Reuse one pooled session for all requests
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    ),
+)
 
 
 def stock_discovery(apikey):
     url = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&topics=blockchain&apikey={apikey}"
-    r = requests.get(url)
-    data = r.json()["feed"]
-    vals_blogs = []
-    keys_stock = list()
-    for i in data:
-        stocks = i["ticker_sentiment"]
-        for stock in stocks:
-            if stock["ticker_sentiment_label"] == "Bullish":
-                if "CRYPTO" not in stock["ticker"]:
-                    vals_blogs.append(i["url"])
-                    keys_stock.append(stock["ticker"])
-
-    res = {keys_stock[i]: vals_blogs[i] for i in range(len(keys_stock))}
+    r = _session.get(url)
+    data = orjson.loads(r.content)["feed"]
+    res = {
+        stock["ticker"]: i["url"]
+        for i in data
+        for stock in i["ticker_sentiment"]
+        if stock["ticker_sentiment_label"] == "Bullish"
+        and "CRYPTO" not in stock["ticker"]
+    }
     print(res)
     return res
 